@@ -0,0 +1,240 @@
+"""Fine-tune ZymCTRL on a causal language modeling objective.
+
+Trimmed from the HuggingFace transformers run_clm.py example, keeping
+only the pieces this workflow uses: plain-text train/validation files
+produced by prep.py, block grouping to the model context length, and a
+standard Trainer loop.
+"""
+
+import math
+import os
+import sys
+from dataclasses import dataclass, field
+from itertools import chain
+from pathlib import Path
+from typing import Optional
+
+import torch
+
+try:
+    from scripts import generate as generation
+except ImportError:
+    # Running as a standalone script from inside scripts/.
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    import generate as generation
+
+from datasets import load_dataset
+from transformers import (
+    AutoConfig,
+    AutoModelForCausalLM,
+    AutoTokenizer,
+    HfArgumentParser,
+    Trainer,
+    TrainingArguments,
+    default_data_collator,
+    set_seed,
+)
+
+
+@dataclass
+class ModelArguments:
+    model_name_or_path: str = field(
+        metadata={"help": "Path to pretrained model or model identifier from the hub."}
+    )
+    tokenizer_name: Optional[str] = field(
+        default=None,
+        metadata={"help": "Pretrained tokenizer name or path if not the same as model_name_or_path."},
+    )
+    cache_dir: Optional[str] = field(
+        default=None,
+        metadata={"help": "Where to store downloaded pretrained models."},
+    )
+    use_lora: bool = field(
+        default=False,
+        metadata={
+            "help": "Train low-rank adapters instead of the full model; the "
+            "base weights stay frozen and adapters are merged for generation."
+        },
+    )
+
+
+@dataclass
+class DataTrainingArguments:
+    train_file: Optional[str] = field(
+        default=None, metadata={"help": "The input training data file (a text file)."}
+    )
+    validation_file: Optional[str] = field(
+        default=None,
+        metadata={"help": "An optional input evaluation data file (a text file)."},
+    )
+    block_size: Optional[int] = field(
+        default=None,
+        metadata={"help": "Optional input sequence length after tokenization. Defaults to the model max length."},
+    )
+    preprocessing_num_workers: Optional[int] = field(
+        default=None,
+        metadata={"help": "The number of processes to use for the preprocessing."},
+    )
+    generate_ec: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "Comma-separated EC numbers to generate sequences for after "
+            "training, reusing the in-memory fine-tuned model."
+        },
+    )
+    generate_output_dir: Optional[str] = field(
+        default=None,
+        metadata={"help": "Directory to write generated sequences under (one subdir per EC)."},
+    )
+    generate_num_batches: int = field(
+        default=20, metadata={"help": "Generation batches per EC number."}
+    )
+    generate_num_return_sequences: int = field(
+        default=20, metadata={"help": "Sequences per generation batch."}
+    )
+
+
+def main(argv=None):
+    parser = HfArgumentParser((ModelArguments, DataTrainingArguments, TrainingArguments))
+    model_args, data_args, training_args = parser.parse_args_into_dataclasses(args=argv)
+
+    set_seed(training_args.seed)
+
+    data_files = {}
+    if data_args.train_file is not None:
+        data_files["train"] = data_args.train_file
+    if data_args.validation_file is not None:
+        data_files["validation"] = data_args.validation_file
+    raw_datasets = load_dataset(
+        "text", data_files=data_files, cache_dir=model_args.cache_dir
+    )
+
+    config = AutoConfig.from_pretrained(
+        model_args.model_name_or_path, cache_dir=model_args.cache_dir
+    )
+    tokenizer = AutoTokenizer.from_pretrained(
+        model_args.tokenizer_name or model_args.model_name_or_path,
+        cache_dir=model_args.cache_dir,
+    )
+    model = AutoModelForCausalLM.from_pretrained(
+        model_args.model_name_or_path,
+        config=config,
+        cache_dir=model_args.cache_dir,
+    )
+
+    if model_args.use_lora:
+        # Frozen base weights mean no fp32 optimizer state for 738M
+        # params, which is what lets the batch size grow on one GPU.
+        from peft import LoraConfig, get_peft_model
+
+        model = get_peft_model(
+            model,
+            LoraConfig(
+                r=16,
+                lora_alpha=32,
+                target_modules=["c_attn", "c_proj"],
+                lora_dropout=0.05,
+                task_type="CAUSAL_LM",
+            ),
+        )
+        # Trainer turns on gradient checkpointing after this wrap, and
+        # with every base weight frozen no checkpointed block output
+        # requires grad — reentrant checkpointing then finds nothing to
+        # backprop through. Hooking the embedding output to require grad
+        # keeps the graph alive through the frozen blocks.
+        model.enable_input_require_grads()
+        model.print_trainable_parameters()
+
+    block_size = data_args.block_size
+    if block_size is None:
+        block_size = min(tokenizer.model_max_length, 1024)
+
+    def tokenize_function(examples):
+        return tokenizer(examples["text"])
+
+    with training_args.main_process_first(desc="dataset map tokenization"):
+        tokenized_datasets = raw_datasets.map(
+            tokenize_function,
+            batched=True,
+            num_proc=data_args.preprocessing_num_workers,
+            remove_columns=["text"],
+            desc="Running tokenizer on dataset",
+        )
+
+    # Concatenate all texts and split into chunks of block_size, as in the
+    # upstream run_clm example.
+    def group_texts(examples):
+        concatenated = {k: list(chain(*examples[k])) for k in examples.keys()}
+        total_length = len(concatenated[list(examples.keys())[0]])
+        total_length = (total_length // block_size) * block_size
+        result = {
+            k: [t[i : i + block_size] for i in range(0, total_length, block_size)]
+            for k, t in concatenated.items()
+        }
+        result["labels"] = result["input_ids"].copy()
+        return result
+
+    with training_args.main_process_first(desc="grouping texts together"):
+        lm_datasets = tokenized_datasets.map(
+            group_texts,
+            batched=True,
+            num_proc=data_args.preprocessing_num_workers,
+            desc=f"Grouping texts in chunks of {block_size}",
+        )
+
+    trainer = Trainer(
+        model=model,
+        args=training_args,
+        train_dataset=lm_datasets["train"] if training_args.do_train else None,
+        eval_dataset=lm_datasets.get("validation") if training_args.do_eval else None,
+        tokenizer=tokenizer,
+        data_collator=default_data_collator,
+    )
+
+    if training_args.do_train:
+        train_result = trainer.train()
+        trainer.save_model()
+        trainer.log_metrics("train", train_result.metrics)
+        trainer.save_metrics("train", train_result.metrics)
+        trainer.save_state()
+
+    if training_args.do_eval:
+        metrics = trainer.evaluate()
+        try:
+            metrics["perplexity"] = math.exp(metrics["eval_loss"])
+        except OverflowError:
+            metrics["perplexity"] = float("inf")
+        trainer.log_metrics("eval", metrics)
+        trainer.save_metrics("eval", metrics)
+
+    if data_args.generate_ec is not None:
+        # Generate straight from the in-memory fine-tuned model instead of
+        # forcing the caller to reload the saved checkpoint in a second
+        # process.
+        gen_model = trainer.model
+        if model_args.use_lora:
+            # trainer.save_model already saved the adapter; generation
+            # wants the merged weights for full-speed dense kernels.
+            gen_model = gen_model.merge_and_unload()
+        gen_model = gen_model.eval()
+        device = next(gen_model.parameters()).device
+        torch.set_grad_enabled(False)
+        output_root = Path(data_args.generate_output_dir or training_args.output_dir)
+        torch.cuda.nvtx.range_push("generate")
+        try:
+            for ec in data_args.generate_ec.split(","):
+                generation.run(
+                    ec,
+                    str(output_root / ec),
+                    gen_model,
+                    tokenizer,
+                    device,
+                    data_args.generate_num_batches,
+                    data_args.generate_num_return_sequences,
+                )
+        finally:
+            torch.cuda.nvtx.range_pop()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
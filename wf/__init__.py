@@ -1,9 +1,11 @@
+from typing import List, Optional
+
 from latch.resources.workflow import workflow
 from latch.types.directory import LatchOutputDir
 from latch.types.file import LatchFile
 from latch.types.metadata import LatchAuthor, LatchMetadata, LatchParameter
 
-from wf.task import task
+from wf.task import zymctrl_task
 
 metadata = LatchMetadata(
     display_name="ZymCTRL",
@@ -11,10 +13,29 @@ metadata = LatchMetadata(
         name="LatchBio",
     ),
     parameters={
-        "input_file": LatchParameter(
-            display_name="Input File",
+        "run_name": LatchParameter(
+            display_name="Run Name",
+            batch_table_column=True,
+        ),
+        "ec_numbers": LatchParameter(
+            display_name="EC Numbers",
+            description="EC numbers to condition sequence generation on.",
             batch_table_column=True,
         ),
+        "fasta_file": LatchParameter(
+            display_name="Training FASTA",
+            description="Optional FASTA of enzyme sequences to fine-tune on before generation.",
+        ),
+        "use_lora": LatchParameter(
+            display_name="Use LoRA",
+            description="Fine-tune low-rank adapters instead of the full model.",
+        ),
+        "num_batches": LatchParameter(
+            display_name="Number of Batches",
+        ),
+        "num_return_sequences": LatchParameter(
+            display_name="Sequences per Batch",
+        ),
         "output_directory": LatchParameter(
             display_name="Output Directory",
             batch_table_column=True,
@@ -25,6 +46,32 @@ metadata = LatchMetadata(
 
 @workflow(metadata)
 def zymctrl_workflow(
-    input_file: LatchFile, output_directory: LatchOutputDir
+    run_name: str,
+    ec_numbers: List[str],
+    output_directory: LatchOutputDir,
+    fasta_file: Optional[LatchFile] = None,
+    use_lora: bool = False,
+    num_batches: int = 20,
+    num_return_sequences: int = 20,
 ) -> LatchOutputDir:
-    return task(input_file=input_file, output_directory=output_directory)
+    """Generate enzyme sequences with ZymCTRL, optionally fine-tuned on user sequences.
+
+    ZymCTRL
+    ----
+
+    [ZymCTRL](https://huggingface.co/AI4PD/ZymCTRL) is a conditional language
+    model trained on the enzyme sequence space. Given an EC (Enzyme
+    Commission) number, it generates artificial enzyme sequences predicted to
+    carry out the corresponding reaction. This workflow generates sequences
+    for one or more EC numbers, ranks them by perplexity, and optionally
+    fine-tunes the model on a user-provided FASTA first.
+    """
+    return zymctrl_task(
+        run_name=run_name,
+        ec_numbers=ec_numbers,
+        output_directory=output_directory,
+        fasta_file=fasta_file,
+        use_lora=use_lora,
+        num_batches=num_batches,
+        num_return_sequences=num_return_sequences,
+    )